@@ -1,7 +1,11 @@
 import tkinter as tk
 from tkinter import ttk  # Themed Tkinter widgets
 from tkinter import messagebox, simpledialog
+import bisect
 import datetime
+import functools
+import threading
+from contextlib import contextmanager
 
 # Import the backend functions
 import store_manager_backend as backend
@@ -14,6 +18,61 @@ BUTTON_BG = "#555555"
 BUTTON_FG = "#FFFFFF"
 TREE_HEADING_BG = "#444444"
 HIGHLIGHT_BG = "#0078D7" # A highlight color like VS Code blue
+HISTORY_PAGE_SIZE = 200 # Transactions fetched per page; more are loaded when scrolled to the bottom
+HISTORY_TIME_FMT = '%Y-%m-%d %H:%M'
+RECEIPT_TIME_FMT = '%Y-%m-%d %H:%M:%S'
+
+# All ttk style settings as a single Tcl script, sent in one go by StoreApp.__init__
+STYLE_SCRIPT = f"""
+# General widget styling
+ttk::style configure . -background {BG_COLOR} -foreground {FG_COLOR} -fieldbackground {ENTRY_BG} -borderwidth 1
+# General hover effect
+ttk::style map . -background {{active {BUTTON_BG}}}
+
+# Button style (darker hover for buttons)
+ttk::style configure TButton -background {BUTTON_BG} -foreground {BUTTON_FG} -padding 6 -font {{Helvetica 10}}
+ttk::style map TButton -background {{active #6A6A6A}}
+
+# Entry style (insertcolor sets the cursor color)
+ttk::style configure TEntry -foreground {FG_COLOR} -insertcolor {FG_COLOR} -font {{Helvetica 10}}
+
+# Label style, with larger title labels
+ttk::style configure TLabel -background {BG_COLOR} -foreground {FG_COLOR} -font {{Helvetica 10}}
+ttk::style configure Title.TLabel -font {{Helvetica 14 bold}}
+
+# Treeview style (fieldbackground is the background when empty) and selection color
+ttk::style configure Treeview -background {ENTRY_BG} -foreground {FG_COLOR} -fieldbackground {ENTRY_BG} -rowheight 25 -font {{Helvetica 10}}
+ttk::style configure Treeview.Heading -background {TREE_HEADING_BG} -foreground {FG_COLOR} -font {{Helvetica 11 bold}} -padding 5
+ttk::style map Treeview.Heading -background {{active #5A5A5A}}
+ttk::style map Treeview -background {{selected {HIGHLIGHT_BG}}} -foreground {{selected {FG_COLOR}}}
+
+# Frame style
+ttk::style configure TFrame -background {BG_COLOR}
+"""
+
+# Tcl procedure that inserts a list of rows into a treeview, so Python crosses into Tcl once per batch.
+# The rows land as a block starting at position `index` (0 = top, "end" = after the last item).
+# They go in back-to-front at that fixed numeric position (cheaper for the Treeview than appending); ids come back in row order.
+BULK_INSERT_PROC = """
+proc bulk_insert {tree rows {index 0}} {
+    if {$index eq "end"} {
+        set index [llength [$tree children {}]]
+    }
+    set ids {}
+    foreach row [lreverse $rows] {
+        lappend ids [$tree insert {} $index -values $row]
+    }
+    return [lreverse $ids]
+}
+"""
+
+@functools.lru_cache(maxsize=1024) # Busy stores repeat timestamps (same second), so skip re-parsing them
+def _fmt_ts(ts, fmt=HISTORY_TIME_FMT, fallback_len=16, _iso=datetime.datetime.fromisoformat):
+    """Formats a DB timestamp string nicely, falling back to the raw text (cut to fallback_len)."""
+    try:
+        return _iso(ts).strftime(fmt)
+    except ValueError:
+        return ts[:fallback_len]
 
 class StoreApp:
     def __init__(self, root):
@@ -21,50 +80,35 @@ class StoreApp:
         self.root.title("Simple Store Manager")
         self.root.geometry("950x650") # Adjusted size
         self.root.configure(bg=BG_COLOR)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # --- Style Configuration ---
         self.style = ttk.Style(self.root)
         self.style.theme_use("clam") # 'clam', 'alt', 'default', 'classic' - 'clam' often works well for coloring
 
-        # General widget styling
-        self.style.configure(".", background=BG_COLOR, foreground=FG_COLOR, fieldbackground=ENTRY_BG, borderwidth=1)
-        self.style.map('.', background=[('active', BUTTON_BG)]) # General hover effect
-
-        # Button style
-        self.style.configure("TButton", background=BUTTON_BG, foreground=BUTTON_FG, padding=6, font=('Helvetica', 10))
-        self.style.map("TButton", background=[('active', '#6A6A6A')]) # Darker hover for buttons
-
-        # Entry style
-        self.style.configure("TEntry", foreground=FG_COLOR, insertcolor=FG_COLOR, font=('Helvetica', 10)) # Set cursor color
-
-        # Label style
-        self.style.configure("TLabel", background=BG_COLOR, foreground=FG_COLOR, font=('Helvetica', 10))
-        self.style.configure("Title.TLabel", font=('Helvetica', 14, 'bold')) # Larger title labels
-
-        # Treeview style
-        self.style.configure("Treeview",
-                             background=ENTRY_BG, # Background of the items area
-                             foreground=FG_COLOR,
-                             fieldbackground=ENTRY_BG, # Background when empty
-                             rowheight=25,
-                             font=('Helvetica', 10))
-        self.style.configure("Treeview.Heading",
-                             background=TREE_HEADING_BG,
-                             foreground=FG_COLOR,
-                             font=('Helvetica', 11, 'bold'),
-                             padding=5)
-        self.style.map("Treeview.Heading", background=[('active', '#5A5A5A')])
-        # Treeview selection color
-        self.style.map('Treeview',
-                       background=[('selected', HIGHLIGHT_BG)],
-                       foreground=[('selected', FG_COLOR)])
-
-        # Frame style
-        self.style.configure("TFrame", background=BG_COLOR)
+        # Apply every style setting (see STYLE_SCRIPT) in one Tcl call instead of one per configure/map
+        self.root.tk.eval(STYLE_SCRIPT)
+        self.root.tk.eval(BULK_INSERT_PROC) # Defines bulk_insert, used by insert_rows
 
         # --- Current Bill State ---
-        self.current_bill_items = [] # List of tuples: (sku, name, price, quantity)
+        self.current_bill_items = {} # sku -> [name, price, quantity] (a list: cheaper to index than a dict)
         self.current_bill_total = 0.0
+        self._tree_shows_bill = False # True while product_tree lists the bill (not products/search results)
+        self._tree_shows_products = False # True while product_tree lists the full inventory
+        self._bill_iid_by_sku = {} # sku -> treeview item id of its bill row
+
+        # --- Cached Backend Data (re-fetched only after a change) ---
+        self._product_cache = None
+        self._product_cache_dirty = True
+        self._history_cache = None # All history pages loaded so far, newest first
+        self._history_cache_dirty = True
+        self._history_exhausted = False # True once the last page has been loaded
+        self._history_load_scheduled = False
+        self._history_loaded = False # History is only loaded once its panel is actually on screen
+        self._db_ready = False # Set once the startup thread has initialized the database
+        self._search_cache = functools.lru_cache(maxsize=64)(backend.find_products) # Repeat searches skip the DB
+        self._search_job = None # Pending debounced search (after id)
+        self._receipt_dialog = None # Created on first use, then hidden and reused
 
         # --- Main Layout Frames ---
         # Control Frame (Top)
@@ -85,6 +129,8 @@ class StoreApp:
 
         # Status Bar (Bottom)
         self.status_var = tk.StringVar()
+        self._pending_status = ""
+        self._status_scheduled = False # True while a status repaint is waiting for idle time
         status_bar = ttk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W, padding=5)
         status_bar.pack(side=tk.BOTTOM, fill=tk.X)
         self.set_status("Welcome!")
@@ -110,6 +156,7 @@ class StoreApp:
         self.search_entry = ttk.Entry(self.billing_actions_frame, textvariable=self.search_var, width=25)
         self.search_entry.grid(row=0, column=1, padx=5, pady=5, sticky='we')
         self.search_entry.bind("<Return>", self.search_and_display_products) # Allow searching with Enter key
+        self.search_var.trace_add("write", self._schedule_search) # Search as you type (debounced)
         ttk.Button(self.billing_actions_frame, text="Search", command=self.search_and_display_products).grid(row=0, column=2, padx=5, pady=5)
 
         ttk.Label(self.billing_actions_frame, text="Quantity:").grid(row=1, column=0, padx=5, pady=5, sticky='w')
@@ -151,33 +198,164 @@ class StoreApp:
         self.history_tree.column("total", width=80, anchor=tk.E)
         self.history_tree.pack(pady=10, fill=tk.BOTH, expand=True)
         self.history_tree.bind("<Double-1>", self.show_transaction_details) # Double-click to view details
+        # The tree reports its visible range here on every scroll/resize; used to load the next page
+        self.history_tree.configure(yscrollcommand=self._on_history_scrolled)
+        self.history_tree.bind("<Map>", self._on_history_mapped)
 
 
         # --- Initial State ---
-        self.populate_product_list() # Load products on startup
-        self.populate_transaction_history() # Load history on startup
+        # Products and history are loaded on a worker thread so the window appears right away
+        self.set_status("Loading...")
+        self.root.after(50, self._bg_bootstrap)
+
+    # --- Startup Loading ---
+    def _bg_bootstrap(self):
+        threading.Thread(target=self._load_initial, daemon=True).start()
+
+    def _load_initial(self):
+        """Runs on the worker thread. Only database I/O here - Tk is not thread-safe."""
+        try:
+            backend.init_db() # Safe to call even if DB exists
+            products = backend.get_all_products()
+        except Exception as e:
+            self.root.after(0, lambda e=e: self._on_load_failed(e))
+            return
+        # Hand the results back to the Tk thread for rendering
+        self.root.after(0, lambda: self._on_initial_data(products))
+
+    def _on_initial_data(self, products):
+        self._db_ready = True
+        if self._product_cache_dirty: # Don't overwrite anything fetched meanwhile
+            self._product_cache = products
+            self._product_cache_dirty = False
+        if not self._tree_shows_bill: # User may have started a bill already
+            self.populate_product_list()
+        if self.history_tree.winfo_ismapped(): # Panel was shown before the DB was ready
+            self._on_history_mapped()
+
+    def _on_history_mapped(self, event=None):
+        # First time the history panel is on screen: load it once the window has painted
+        if not self._history_loaded and self._db_ready:
+            self._history_loaded = True
+            self.root.after_idle(self.populate_transaction_history)
+
+    def on_close(self):
+        # Fold the WAL back into the database file so it is left tidy, then quit
+        if self._db_ready:
+            try:
+                backend.force_checkpoint()
+            except Exception:
+                pass # Nothing is lost: SQLite replays the WAL next time it opens the file
+        self.root.destroy()
+
+    def _on_load_failed(self, error):
+        messagebox.showerror("Database Error", f"Failed to initialize or connect to database: {error}\nApplication will exit.")
+        self.root.destroy()
 
     # --- Helper Methods ---
     def set_status(self, message, error=False):
-        self.status_var.set(message)
+        # Only remember the message; a burst of updates is painted once when Tk is idle
+        self._pending_status = message
+        if not self._status_scheduled:
+            self._status_scheduled = True
+            self.root.after_idle(self._flush_status)
         if error:
-            self.root.after(5000, lambda: self.status_var.set("")) # Clear error after 5s
+            self.root.after(5000, lambda: self.set_status("")) # Clear error after 5s
         # Could add color change for errors later
 
+    def _flush_status(self):
+        self._status_scheduled = False
+        self.status_var.set(self._pending_status)
+
     def clear_treeview(self, tree):
-        for item in tree.get_children():
-            tree.delete(item)
+        items = tree.get_children()
+        if items:
+            tree.delete(*items) # One Tcl call for all rows
+
+    def insert_row(self, tree, values):
+        """Inserts one row by calling the Tcl command directly (skips Treeview.insert's option handling)."""
+        return tree.tk.call(tree._w, "insert", "", "end", "-values", values)
+
+    def insert_rows(self, tree, rows, index=0):
+        """Inserts all rows into a treeview with a single Tcl call, as a block at index (0 or "end"). Returns the new item ids."""
+        if not rows:
+            return ()
+        # Tkinter turns the list of tuples into a Tcl list, so names with braces/spaces need no escaping
+        return tree.tk.splitlist(tree.tk.call("bulk_insert", tree._w, rows, index))
+
+    @contextmanager
+    def _frozen(self, tree):
+        """Takes a treeview out of the layout while it is filled, then packs it back in the same spot."""
+        info = tree.pack_info()
+        info.pop("in", None)
+        siblings = tree.master.pack_slaves()
+        position = siblings.index(tree)
+        if position + 1 < len(siblings):
+            info["before"] = siblings[position + 1] # Keep packing order (billing frames come after the tree)
+        tree.pack_forget()
+        try:
+            yield
+        finally:
+            tree.pack(**info)
+
+    def _get_products(self):
+        """Returns the product list, only querying the backend if inventory changed."""
+        if self._product_cache_dirty:
+            self._product_cache = backend.get_all_products()
+            self._product_cache_dirty = False
+        return self._product_cache
+
+    def _inventory_changed(self):
+        """Marks cached product data stale after an add, remove or sale."""
+        self._product_cache_dirty = True
+        self._search_cache.cache_clear()
+
+    def _product_added(self, row):
+        """Puts a newly added product into the cache and list without reloading the inventory."""
+        self._search_cache.cache_clear()
+        if self._product_cache_dirty:
+            self.populate_product_list() # Nothing cached to update, load it all
+            return
+        # Keep the cache in the same name order the backend returns
+        names = [product[1] for product in self._product_cache] # bisect's key= needs Python 3.10+
+        index = bisect.bisect_right(names, row[1])
+        self._product_cache.insert(index, row)
+        if self._tree_shows_products:
+            self.product_tree.insert("", index, values=self.product_rows([row])[0])
+        else:
+            self.populate_product_list() # Switch to the product list (from the cache)
+
+    def _product_removed(self, sku, item):
+        """Drops a removed product from the cache and list without reloading the inventory."""
+        self._search_cache.cache_clear()
+        if not self._product_cache_dirty:
+            self._product_cache = [product for product in self._product_cache if product[0] != sku]
+        if self._tree_shows_products:
+            self.product_tree.delete(item)
+        else:
+            self.populate_product_list()
+
+    def _get_history(self):
+        """Returns the loaded transaction history, fetching the first page if needed."""
+        if self._history_cache_dirty:
+            self._history_cache = list(backend.get_transaction_history(limit=HISTORY_PAGE_SIZE))
+            self._history_exhausted = len(self._history_cache) < HISTORY_PAGE_SIZE
+            self._history_cache_dirty = False
+        return self._history_cache
 
     # --- Product List Methods ---
     def populate_product_list(self, products=None):
         """Populates the main treeview with product data."""
         self.clear_treeview(self.product_tree)
+        self._tree_shows_bill = False
+        self._tree_shows_products = True
         self.product_tree.heading("qty", text="Stock") # Label as Stock
         try:
             if products is None:
-                products = backend.get_all_products()
-            for sku, name, price, quantity in products:
-                self.product_tree.insert("", tk.END, values=(sku, name, f"{price:.2f}", quantity))
+                products = self._get_products()
+            rows = self.product_rows(products) # All formatting done before any Tcl work
+            with self._frozen(self.product_tree): # No layout/redraw work while rows go in
+                self.insert_rows(self.product_tree, rows)
             if not products:
                  self.set_status("Inventory is empty.")
             else:
@@ -201,7 +379,7 @@ class StoreApp:
                 # Call backend
                 success_msg = backend.add_product(sku, name, price, quantity)
                 messagebox.showinfo("Success", success_msg)
-                self.populate_product_list() # Refresh the list
+                self._product_added((sku.strip().upper(), name.strip(), price, quantity)) # Stored like the backend does
                 self.set_status(success_msg)
             except ValueError as ve:
                 messagebox.showerror("Input Error", str(ve))
@@ -225,7 +403,7 @@ class StoreApp:
             try:
                 success_msg = backend.remove_product(sku_to_remove)
                 messagebox.showinfo("Success", success_msg)
-                self.populate_product_list() # Refresh
+                self._product_removed(sku_to_remove, selected_item)
                 self.set_status(success_msg)
             except ValueError as ve: # Specific errors from backend
                 messagebox.showerror("Removal Error", str(ve))
@@ -237,12 +415,15 @@ class StoreApp:
     # --- Billing Methods ---
     def start_billing_mode(self):
         self.set_status("Billing mode active. Search and add items.")
-        self.current_bill_items = []
+        self.current_bill_items = {}
         self.current_bill_total = 0.0
         self.update_bill_summary()
 
         # Configure product tree for billing (show items in bill)
         self.clear_treeview(self.product_tree)
+        self._tree_shows_bill = True # The (empty) bill is now on screen
+        self._tree_shows_products = False
+        self._bill_iid_by_sku = {}
         self.product_tree.heading("qty", text="Quantity") # Label as Qty for bill items
         # Add columns if they don't exist or reconfigure? For now, just reuse.
 
@@ -260,8 +441,12 @@ class StoreApp:
              return
 
          self.set_status("Billing cancelled. Displaying all products.")
-         self.current_bill_items = []
+         self.current_bill_items = {}
          self.current_bill_total = 0.0
+         self._bill_iid_by_sku = {}
+         if self._search_job is not None: # A search typed just before leaving must not replace the product list
+             self.root.after_cancel(self._search_job)
+             self._search_job = None
 
          # Hide billing controls
          self.billing_actions_frame.pack_forget()
@@ -271,22 +456,37 @@ class StoreApp:
          self.populate_product_list()
 
 
+    def _schedule_search(self, *args):
+        # Restart the timer on every change so a burst of keystrokes causes a single search
+        if self._search_job is not None:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(200, self._run_scheduled_search)
+
+    def _run_scheduled_search(self):
+        self._search_job = None
+        if self.search_var.get().strip(): # Cleared box: just wait for more typing
+            self.search_and_display_products()
+
     def search_and_display_products(self, event=None): # event=None allows binding to <Return>
+        if self._search_job is not None: # Searching now, drop the pending one
+            self.root.after_cancel(self._search_job)
+            self._search_job = None
         search_term = self.search_var.get()
         if not search_term:
             messagebox.showinfo("Search", "Please enter a SKU or name to search.")
             return
 
         try:
-            results = backend.find_products(search_term)
+            results = self._search_cache(search_term)
             self.clear_treeview(self.product_tree)
+            self._tree_shows_bill = False
+            self._tree_shows_products = False
             self.product_tree.heading("qty", text="Stock") # Show Stock in search results
             if not results:
-                 self.product_tree.insert("", tk.END, values=("", f"No products found matching '{search_term}'", "", ""))
+                 self.insert_row(self.product_tree, ("", f"No products found matching '{search_term}'", "", ""))
                  self.set_status(f"No products found matching '{search_term}'.")
             else:
-                 for sku, name, price, quantity in results:
-                     self.product_tree.insert("", tk.END, values=(sku, name, f"{price:.2f}", quantity))
+                 self.insert_rows(self.product_tree, self.product_rows(results))
                  self.set_status(f"Found {len(results)} product(s). Select one to add.")
         except Exception as e:
             messagebox.showerror("Search Error", f"Error searching products: {e}")
@@ -317,12 +517,20 @@ class StoreApp:
             if qty_to_add > stock:
                 raise ValueError(f"Not enough stock for '{name}'. Only {stock} available.")
 
-            # Check if item already in bill, if so, maybe update qty? For simplicity, just add.
-            # A more robust approach would merge quantities.
-            self.current_bill_items.append((sku, name, price, qty_to_add))
+            # Merge into the existing bill line for this SKU (keeps the price it was first added at)
+            entry = self.current_bill_items.setdefault(sku, [name, price, 0])
+            entry[2] += qty_to_add
             self.current_bill_total += price * qty_to_add
             self.update_bill_summary()
-            self.display_current_bill() # Update the treeview to show the bill
+            if self._tree_shows_bill:
+                # Bill already on screen: only touch the one affected row
+                iid = self._bill_iid_by_sku.get(sku)
+                if iid is None:
+                    self._bill_iid_by_sku[sku] = self.insert_row(self.product_tree, (sku, name, f"{price:.2f}", entry[2]))
+                else:
+                    self.product_tree.set(iid, "qty", entry[2])
+            else:
+                self.display_current_bill() # Switch the treeview from search results to the bill
             self.set_status(f"Added {qty_to_add} x {name} to bill.")
             self.qty_var.set("1") # Reset quantity entry
 
@@ -334,19 +542,16 @@ class StoreApp:
     def display_current_bill(self):
          """Updates the treeview to show items currently in the bill."""
          self.clear_treeview(self.product_tree)
+         self._tree_shows_bill = True
+         self._tree_shows_products = False
          self.product_tree.heading("qty", text="Quantity") # Show Quantity being bought
          self.product_tree.heading("price", text="Unit Price")
          # Maybe add a 'Total Price' column? For simplicity, keeping it to 4 cols.
 
-         temp_bill_summary = {} # Use dict to aggregate quantities for display
-         for sku, name, price, qty in self.current_bill_items:
-             if sku in temp_bill_summary:
-                 temp_bill_summary[sku]['qty'] += qty
-             else:
-                 temp_bill_summary[sku] = {'name': name, 'price': price, 'qty': qty}
-
-         for sku, item_data in temp_bill_summary.items():
-              self.product_tree.insert("", tk.END, values=(sku, item_data['name'], f"{item_data['price']:.2f}", item_data['qty']))
+         # Bill items are already aggregated per SKU
+         rows = self.product_rows((sku, name, price, qty) for sku, (name, price, qty) in self.current_bill_items.items())
+         iids = self.insert_rows(self.product_tree, rows)
+         self._bill_iid_by_sku = dict(zip(self.current_bill_items, iids)) # Remember rows for incremental updates
 
 
     def update_bill_summary(self):
@@ -358,28 +563,22 @@ class StoreApp:
             messagebox.showwarning("Empty Bill", "Cannot checkout an empty bill.")
             return
 
-        # Aggregate items before sending to backend (handles duplicates added separately)
-        final_bill_items = []
-        aggregated = {} # sku -> {'name': name, 'price': price, 'total_qty': qty}
-        for sku, name, price, qty in self.current_bill_items:
-             if sku not in aggregated:
-                 aggregated[sku] = {'name': name, 'price': price, 'total_qty': 0}
-             aggregated[sku]['total_qty'] += qty
-             # Use the price from the *first* time the item was added in this bill
-             # A real POS might handle price changes differently.
+        # Items are aggregated as they are added, so this is just a conversion
+        final_bill_items = [(sku, name, price, qty)
+                            for sku, (name, price, qty) in self.current_bill_items.items()]
 
-        for sku, data in aggregated.items():
-             final_bill_items.append((sku, data['name'], data['price'], data['total_qty']))
-
-
-        receipt_preview = "Checkout Confirmation:\n\n"
+        # Collect lines in a list and join once (repeated += copies the whole string each time)
+        parts = ["Checkout Confirmation:\n\n"]
+        append = parts.append # Hoisted out of the loop
         for sku, name, price, qty in final_bill_items:
-             receipt_preview += f"{qty} x {name} ({sku}) @ ${price:.2f} = ${qty*price:.2f}\n"
-        receipt_preview += f"\nTOTAL: ${self.current_bill_total:.2f}"
+             append(f"{qty} x {name} ({sku}) @ ${price:.2f} = ${qty*price:.2f}\n")
+        append(f"\nTOTAL: ${self.current_bill_total:.2f}")
+        receipt_preview = "".join(parts)
 
         if messagebox.askyesno("Confirm Checkout", receipt_preview):
             try:
                 transaction_id = backend.process_sale(final_bill_items)
+                self._inventory_changed() # Stock levels changed
                 self.set_status(f"Checkout successful! Transaction ID: {transaction_id}")
                 messagebox.showinfo("Sale Complete", f"Transaction {transaction_id} recorded.")
                 # Offer to show receipt
@@ -388,7 +587,7 @@ class StoreApp:
 
                 # Exit billing mode and refresh background data
                 self.cancel_billing_mode() # Resets state and shows product list
-                self.populate_transaction_history() # Update history list
+                self.add_to_history(transaction_id) # Prepend the new sale to the history list
 
             except ValueError as ve: # Stock errors etc.
                 messagebox.showerror("Checkout Error", str(ve))
@@ -400,23 +599,56 @@ class StoreApp:
 
 
     # --- Transaction History Methods ---
+    def product_rows(self, products):
+        """Formats (sku, name, price, quantity) tuples for the product treeview."""
+        return [(sku, name, f"{price:.2f}", quantity) for sku, name, price, quantity in products]
+
+    def history_rows(self, history):
+        """Formats (id, timestamp, total) tuples for the history treeview."""
+        return [(trans_id, _fmt_ts(timestamp), f"{total:.2f}") for trans_id, timestamp, total in history]
+
     def populate_transaction_history(self):
+        self._history_loaded = True
         self.clear_treeview(self.history_tree)
         try:
-            history = backend.get_transaction_history()
-            for trans_id, timestamp, total in history:
-                try:
-                    # Attempt to format timestamp nicely
-                    dt_object = datetime.datetime.fromisoformat(timestamp)
-                    formatted_time = dt_object.strftime('%Y-%m-%d %H:%M')
-                except ValueError:
-                    formatted_time = timestamp[:16] # Fallback
-                self.history_tree.insert("", tk.END, values=(trans_id, formatted_time, f"{total:.2f}"))
+            history = self._get_history()
+            with self._frozen(self.history_tree):
+                self.insert_rows(self.history_tree, self.history_rows(history))
             # self.set_status("Transaction history loaded.") # Avoid overriding other statuses too quickly
         except Exception as e:
             messagebox.showerror("History Error", f"Could not load transaction history: {e}")
             self.set_status(f"Error loading history: {e}", error=True)
 
+    def _on_history_scrolled(self, first, last):
+        # Bottom of the history is visible: fetch the next page once Tk is idle
+        if float(last) >= 1.0 and not self._history_exhausted and not self._history_load_scheduled:
+            self._history_load_scheduled = True
+            self.root.after_idle(self.load_more_history)
+
+    def load_more_history(self):
+        """Appends the next page of older transactions to the history list."""
+        self._history_load_scheduled = False
+        if self._history_cache_dirty or self._history_exhausted:
+            return
+        try:
+            page = backend.get_transaction_history(limit=HISTORY_PAGE_SIZE, offset=len(self._history_cache))
+            self._history_exhausted = len(page) < HISTORY_PAGE_SIZE
+            self._history_cache.extend(page)
+            self.insert_rows(self.history_tree, self.history_rows(page), "end") # Older transactions go below
+        except Exception as e:
+            self.set_status(f"Error loading more history: {e}", error=True)
+
+    def add_to_history(self, transaction_id):
+        """Puts a just-recorded transaction at the top of the history without reloading it."""
+        if self._history_cache_dirty:
+            return # History not loaded yet; the new sale is included when it is
+        try:
+            trans_info, _ = backend.get_transaction_details(transaction_id)
+            self._history_cache.insert(0, trans_info)
+            self.history_tree.insert("", 0, values=self.history_rows([trans_info])[0])
+        except Exception as e:
+            self.set_status(f"Error updating history: {e}", error=True)
+
     def show_transaction_details(self, event): # Triggered by double-click
         selected_item = self.history_tree.focus()
         if not selected_item:
@@ -431,29 +663,26 @@ class StoreApp:
         try:
             trans_info, items = backend.get_transaction_details(transaction_id)
             tid, timestamp, total = trans_info
-            try:
-                dt_object = datetime.datetime.fromisoformat(timestamp)
-                formatted_time = dt_object.strftime('%Y-%m-%d %H:%M:%S')
-            except ValueError:
-                formatted_time = timestamp
-
-            receipt_text = f"--- RECEIPT ---\n"
-            receipt_text += f"Transaction ID: {tid}\n"
-            receipt_text += f"Date: {formatted_time}\n"
-            receipt_text += "-" * 30 + "\n"
-            receipt_text += f"{'Qty':<4} {'Item':<15} {'Price':>8}\n"
-            receipt_text += "-" * 30 + "\n"
-            calculated_total = 0
+            formatted_time = _fmt_ts(timestamp, RECEIPT_TIME_FMT, fallback_len=None) # Full text as fallback
+
+            parts = ["--- RECEIPT ---\n",
+                     f"Transaction ID: {tid}\n",
+                     f"Date: {formatted_time}\n",
+                     "-" * 30 + "\n",
+                     f"{'Qty':<4} {'Item':<15} {'Price':>8}\n",
+                     "-" * 30 + "\n"]
+            append = parts.append # Hoisted out of the loop
             for qty, name, sku, price in items:
-                item_total = qty * price
-                calculated_total += item_total
-                receipt_text += f"{qty:<4} {name[:15]:<15} {item_total:>8.2f}\n" # Truncate name
-            receipt_text += "-" * 30 + "\n"
-            receipt_text += f"{'TOTAL:':<21} ${total:>8.2f}\n"
-            receipt_text += "--- Thank You! ---"
+                append(f"{qty:<4} {name[:15]:<15} {qty * price:>8.2f}\n") # Truncate name
+            append("-" * 30 + "\n")
+            append(f"{'TOTAL:':<21} ${total:>8.2f}\n")
+            append("--- Thank You! ---")
+            receipt_text = "".join(parts)
 
-            # Use a simple dialog or a Toplevel window with a Text widget
-            ReceiptDialog(self.root, f"Receipt - ID: {transaction_id}", receipt_text, self.style)
+            # Use a simple dialog or a Toplevel window with a Text widget (built once, then reused)
+            if self._receipt_dialog is None:
+                self._receipt_dialog = ReceiptDialog(self.root, self.style)
+            self._receipt_dialog.show(f"Receipt - ID: {transaction_id}", receipt_text)
 
         except Exception as e:
             messagebox.showerror("Receipt Error", f"Could not fetch details for transaction {transaction_id}: {e}")
@@ -513,40 +742,49 @@ class AddProductDialog(simpledialog.Dialog):
                        self.qty_entry.get())
 
 class ReceiptDialog(tk.Toplevel):
-     def __init__(self, parent, title, text_content, style):
+     """Receipt window that is built once and then hidden/shown again for each receipt."""
+     def __init__(self, parent, style):
         super().__init__(parent)
-        self.title(title)
+        self.withdraw() # Stay hidden until show() is called
         self.geometry("350x450") # Adjust size as needed
         self.configure(bg=BG_COLOR)
-        # Make it modal (optional)
-        self.grab_set() # Prevent interaction with main window
-        self.focus_set()
         self.transient(parent) # Keep it on top of parent
+        self.protocol("WM_DELETE_WINDOW", self.hide) # Window close button hides instead of destroying
+        self.is_open = tk.BooleanVar(self, value=False)
 
         # Use a Text widget for easy multi-line display and selection
-        text_widget = tk.Text(self, wrap=tk.WORD, height=20, width=45,
+        self.text_widget = tk.Text(self, wrap=tk.WORD, height=20, width=45,
                              bg=ENTRY_BG, fg=FG_COLOR,
                              font=("Courier", 10), # Monospaced font for alignment
                              borderwidth=0, highlightthickness=0) # Simple look
-        text_widget.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
-        text_widget.insert(tk.END, text_content)
-        text_widget.config(state=tk.DISABLED) # Make it read-only
+        self.text_widget.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
 
-        close_button = ttk.Button(self, text="Close", command=self.destroy)
+        close_button = ttk.Button(self, text="Close", command=self.hide)
         close_button.pack(pady=10)
 
-        self.wait_window(self) # Wait until this window is closed
+     def show(self, title, text_content):
+        self.title(title)
+        self.text_widget.config(state=tk.NORMAL)
+        self.text_widget.delete("1.0", tk.END)
+        self.text_widget.insert(tk.END, text_content)
+        self.text_widget.config(state=tk.DISABLED) # Make it read-only
+
+        self.deiconify()
+        # Make it modal (optional)
+        self.grab_set() # Prevent interaction with main window
+        self.focus_set()
+        self.is_open.set(True)
+        self.wait_variable(self.is_open) # Wait until this window is closed (hidden)
+
+     def hide(self):
+        self.grab_release()
+        self.withdraw()
+        self.is_open.set(False)
 
 
 # --- Main Execution ---
 if __name__ == "__main__":
-    # Ensure DB exists before starting GUI
-    try:
-        backend.init_db() # Safe to call even if DB exists
-    except Exception as e:
-        messagebox.showerror("Database Error", f"Failed to initialize or connect to database: {e}\nApplication will exit.")
-        exit()
-
+    # The database is initialized by StoreApp on a background thread
     root = tk.Tk()
     app = StoreApp(root)
     root.mainloop()
\ No newline at end of file
@@ -1,146 +1,548 @@
 import sqlite3
+import collections
+import concurrent.futures
 import datetime
 import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import apsw # Optional: thinner wrapper around SQLite, used for the read-only pool when enabled
+except ImportError:
+    apsw = None
 
 DB_FILE = 'inventory.db'
+# Set STORE_DB_DRIVER=apsw to serve reads through apsw (if installed). Writes always use sqlite3.
+USE_APSW = apsw is not None and os.environ.get("STORE_DB_DRIVER", "sqlite3").lower() == "apsw"
+
+# --- Database Initialization ---
+# Run once on the first read/write connection (see _ensure_schema); every statement is IF NOT EXISTS
+SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS products (
+        sku TEXT PRIMARY KEY, name TEXT NOT NULL, price REAL NOT NULL CHECK(price >= 0),
+        quantity INTEGER NOT NULL CHECK(quantity >= 0) );
+    CREATE TABLE IF NOT EXISTS transactions (
+        transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, total_amount REAL NOT NULL );
+    CREATE TABLE IF NOT EXISTS transaction_items (
+        item_id INTEGER PRIMARY KEY AUTOINCREMENT, transaction_id INTEGER NOT NULL,
+        product_sku TEXT NOT NULL, quantity_sold INTEGER NOT NULL,
+        price_at_sale REAL NOT NULL, name_at_sale TEXT, -- Product name as printed on the receipt
+        FOREIGN KEY(transaction_id) REFERENCES transactions(transaction_id),
+        FOREIGN KEY(product_sku) REFERENCES products(sku) ON DELETE RESTRICT ); -- Added ON DELETE RESTRICT
+
+    -- Indexes: receipt lookups by transaction, and name prefix search (NOCASE so LIKE can use it)
+    CREATE INDEX IF NOT EXISTS idx_ti_txid ON transaction_items(transaction_id);
+    CREATE INDEX IF NOT EXISTS idx_products_name ON products(name COLLATE NOCASE);
+
+    -- Keep each transaction's total in step with its items, whoever inserts them
+    CREATE TRIGGER IF NOT EXISTS trg_ti_total AFTER INSERT ON transaction_items
+    BEGIN
+        UPDATE transactions SET total_amount = total_amount + NEW.quantity_sold * NEW.price_at_sale
+        WHERE transaction_id = NEW.transaction_id;
+    END;
+'''
+# Substring search index over product names. Optional: not every SQLite build has FTS5 (trigram needs 3.34+)
+# Keyed on products' implicit rowid, so run "INSERT INTO products_fts(products_fts) VALUES ('rebuild')" after a VACUUM
+FTS_TABLE_SQL = '''
+    CREATE VIRTUAL TABLE products_fts USING fts5(name, content='products', content_rowid='rowid', tokenize='trigram');
+'''
+FTS_TRIGGERS_SQL = '''
+    -- Mirror name changes only; stock updates from sales don't touch the index
+    CREATE TRIGGER IF NOT EXISTS trg_products_fts_ins AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name) VALUES (NEW.rowid, NEW.name);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_products_fts_del AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', OLD.rowid, OLD.name);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_products_fts_upd AFTER UPDATE OF sku, name ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', OLD.rowid, OLD.name);
+        INSERT INTO products_fts(rowid, name) VALUES (NEW.rowid, NEW.name);
+    END;
+
+    -- Index the products that were there before the table (or its triggers) existed
+    INSERT INTO products_fts(products_fts) VALUES ('rebuild');
+'''
+# Used when the file has products_fts but this SQLite can't run it: without these, every product write would fail
+FTS_DROP_TRIGGERS_SQL = '''
+    DROP TRIGGER IF EXISTS trg_products_fts_ins;
+    DROP TRIGGER IF EXISTS trg_products_fts_del;
+    DROP TRIGGER IF EXISTS trg_products_fts_upd;
+'''
+_schema_ready = False
+_fts_enabled = False # True once products_fts exists and works; find_products falls back to LIKE otherwise
+
+def _ensure_fts(conn):
+    # Creates and fills products_fts if this SQLite supports it. Returns whether it can be used.
+    # The file may have been created by a different SQLite, so an existing table is probed before it's trusted.
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'").fetchone() is not None
+    try:
+        if exists:
+            conn.execute('''SELECT rowid FROM products_fts WHERE products_fts MATCH '"xyz"' LIMIT 0''').fetchall()
+            triggers = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_products_fts_%'").fetchone()[0]
+            if triggers == 3:
+                return True
+            script = FTS_TRIGGERS_SQL # Dropped by an SQLite that couldn't use them: put back and re-sync
+        else:
+            script = FTS_TABLE_SQL + FTS_TRIGGERS_SQL
+        conn.executescript("BEGIN;" + script + "COMMIT;") # All or nothing
+        return True
+    except sqlite3.OperationalError: # No FTS5 or no trigram tokenizer
+        if conn.in_transaction:
+            conn.rollback()
+        if exists:
+            conn.executescript(FTS_DROP_TRIGGERS_SQL) # Keep add/remove working; find_products uses LIKE
+        return False
+
+# Brings databases created by older versions up to date. Added columns can't use IF NOT EXISTS, so check first.
+SQL_ADD_NAME_AT_SALE = 'ALTER TABLE transaction_items ADD COLUMN name_at_sale TEXT'
+# Fills in names for past sales from the products table. Only touches rows still missing one,
+# so it also finishes a backfill that an earlier run didn't complete.
+SQL_BACKFILL_NAME_AT_SALE = '''
+    UPDATE transaction_items SET name_at_sale = (SELECT name FROM products WHERE sku = product_sku)
+    WHERE name_at_sale IS NULL
+'''
+
+def _migrate(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(transaction_items)")]
+    missing = 'name_at_sale' not in columns
+    if not missing and not conn.execute("SELECT 1 FROM transaction_items WHERE name_at_sale IS NULL LIMIT 1").fetchone():
+        return # Up to date
+    try:
+        conn.execute('BEGIN IMMEDIATE') # Add the column and backfill it together, or not at all
+        if missing:
+            conn.execute(SQL_ADD_NAME_AT_SALE)
+        conn.execute(SQL_BACKFILL_NAME_AT_SALE)
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+def _ensure_schema(conn):
+    # Creates the tables the first time a read/write connection is opened, then does nothing
+    global _schema_ready
+    if _schema_ready:
+        return
+    if DB_FILE != ':memory:': # In-memory databases can't use WAL
+        conn.execute("PRAGMA journal_mode = WAL") # Stored in the file, so once is enough. Readers don't block writers
+    conn.executescript(SCHEMA_SQL)
+    _migrate(conn)
+    global _fts_enabled
+    _fts_enabled = _ensure_fts(conn)
+    _schema_ready = True
+    _start_checkpointer()
 
-# --- Database Initialization (Keep as is) ---
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    # (Keep table creation queries exactly as before)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            sku TEXT PRIMARY KEY, name TEXT NOT NULL, price REAL NOT NULL CHECK(price >= 0),
-            quantity INTEGER NOT NULL CHECK(quantity >= 0) ) ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, total_amount REAL NOT NULL ) ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transaction_items (
-            item_id INTEGER PRIMARY KEY AUTOINCREMENT, transaction_id INTEGER NOT NULL,
-            product_sku TEXT NOT NULL, quantity_sold INTEGER NOT NULL,
-            price_at_sale REAL NOT NULL,
-            FOREIGN KEY(transaction_id) REFERENCES transactions(transaction_id),
-            FOREIGN KEY(product_sku) REFERENCES products(sku) ON DELETE RESTRICT ) ''') # Added ON DELETE RESTRICT
-    conn.commit()
-    conn.close()
-    # print(f"Database '{DB_FILE}' initialized successfully.") # GUI will handle messages
-
-
-# --- Database Connection ---
-def get_db_connection():
-    """Gets a connection to the DB. Remember to close it!"""
-    conn = sqlite3.connect(DB_FILE)
-    conn.execute("PRAGMA foreign_keys = ON") # Good practice
+    """Makes sure the database file and tables exist. Optional: the first query does this anyway."""
+    _submit(lambda conn: None).result() # The writer thread's rw_conn() runs _ensure_schema
+
+
+# --- Database Connection Pool ---
+# Connections stay open between calls: one read/write connection shared under a lock,
+# plus a small pool of read-only connections so reads don't queue behind writes (WAL allows this).
+RO_POOL_SIZE = 4
+_rw_conn = None
+_rw_lock = threading.Lock()
+_ro_pool = queue.LifoQueue(maxsize=RO_POOL_SIZE)
+
+def _connect(database, uri=False):
+    # Autocommit mode (isolation_level=None): writes open their own BEGIN and COMMIT explicitly.
+    # A bigger statement cache keeps every SQL_* statement below compiled for the life of the connection.
+    return sqlite3.connect(database, uri=uri, check_same_thread=False,
+                           isolation_level=None, cached_statements=256)
+
+# Per-connection settings: foreign keys (good practice), fewer fsyncs (safe with WAL),
+# temp tables in RAM, ~20MB page cache, memory-mapped reads and waiting up to 5s on a lock.
+# Automatic checkpoints are off: they would run inside whichever commit crosses 1000 pages
+# and stall that sale, so the background checkpointer below does them instead.
+CONNECTION_PRAGMAS = """
+    PRAGMA foreign_keys = ON;
+    PRAGMA synchronous = NORMAL;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA cache_size = -20000;
+    PRAGMA mmap_size = 268435456;
+    PRAGMA busy_timeout = 5000;
+    PRAGMA wal_autocheckpoint = 0;
+"""
+
+def _configure_connection(conn):
+    conn.executescript(CONNECTION_PRAGMAS)
     return conn
 
+def _connect_ro():
+    # New read-only connection for the pool, through apsw when USE_APSW is set
+    if USE_APSW:
+        conn = apsw.Connection(DB_FILE, flags=apsw.SQLITE_OPEN_READONLY, statementcachesize=256)
+        # apsw stops at the first statement that returns a row (mmap_size does), so read the
+        # cursor to the end or the pragmas after it never run
+        for _ in _execute(conn, CONNECTION_PRAGMAS):
+            pass
+        settings = (_execute(conn, "PRAGMA busy_timeout").fetchone()[0],
+                    _execute(conn, "PRAGMA wal_autocheckpoint").fetchone()[0])
+        if settings != (5000, 0): # Check the last pragmas really took effect
+            conn.close()
+            raise RuntimeError(f"apsw connection settings not applied (busy_timeout, wal_autocheckpoint = {settings})")
+        return conn
+    return _configure_connection(_connect(f"file:{DB_FILE}?mode=ro", uri=True))
+
+def _execute(conn, sql, params=()):
+    """Runs one query and returns its cursor. Works the same on sqlite3 and apsw connections."""
+    return conn.cursor().execute(sql, params)
+
+def _rows(cursor):
+    # Streams a cursor's rows, FETCH_CHUNK at a time where the driver supports fetchmany (apsw doesn't)
+    if not hasattr(cursor, "fetchmany"):
+        yield from cursor
+        return
+    while True:
+        rows = cursor.fetchmany(FETCH_CHUNK)
+        if not rows:
+            break
+        yield from rows
+
+@contextmanager
+def rw_conn():
+    """Yields the shared read/write connection. Only one caller at a time; uncommitted work is rolled back."""
+    global _rw_conn
+    with _rw_lock:
+        if _rw_conn is None:
+            _rw_conn = _configure_connection(_connect(DB_FILE))
+        try:
+            _ensure_schema(_rw_conn) # Inside the try so a failed setup step is rolled back too
+            yield _rw_conn
+        finally:
+            if _rw_conn.in_transaction:
+                _rw_conn.rollback()
+
+@contextmanager
+def ro_conn():
+    """Yields a pooled read-only connection and returns it to the pool afterwards."""
+    if DB_FILE == ':memory:': # Each connection would get its own empty DB, so share the one with the data
+        if not _schema_ready:
+            init_db() # Leave creating the tables to the writer thread
+        with rw_conn() as conn:
+            yield conn
+        return
+    try:
+        conn = _ro_pool.get_nowait()
+    except queue.Empty:
+        if not _schema_ready: # A read-only connection can't create the file or tables
+            init_db()
+        conn = _connect_ro()
+    try:
+        yield conn
+    finally:
+        if isinstance(conn, sqlite3.Connection) and conn.in_transaction: # apsw reads never leave one open
+            conn.rollback()
+        try:
+            _ro_pool.put_nowait(conn)
+        except queue.Full: # More readers than the pool keeps
+            conn.close()
+
+# --- Writer Thread ---
+# Every write (schema setup and migrations in init_db, add, remove, sale, force_checkpoint) runs on one
+# long-lived thread. Callers queue a job and wait on its Future, so writers never fight over the database lock.
+# _rw_lock is still needed: with DB_FILE = ':memory:' reads share the read/write connection from their own thread.
+# (The background checkpointer uses its own connection and only copies committed pages, it doesn't change data.)
+_write_q = queue.Queue()
+_writer = None
+_writer_start_lock = threading.Lock()
+
+def _writer_loop():
+    while True:
+        job, future = _write_q.get()
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            with rw_conn() as conn:
+                result = job(conn)
+        except BaseException as e: # Hand every error back to the caller, keep the thread alive
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+def _submit(job):
+    """Queues job(conn) for the writer thread. Returns a concurrent.futures.Future with its result."""
+    global _writer
+    with _writer_start_lock:
+        if _writer is None: # Started on the first write
+            _writer = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+            _writer.start()
+    future = concurrent.futures.Future()
+    _write_q.put((job, future))
+    return future
+
+# --- WAL Checkpointing ---
+CHECKPOINT_INTERVAL = 5 # Seconds between background checkpoints
+_checkpointer = None
+
+def _checkpoint_loop():
+    # Copies committed WAL pages back into the database file every few seconds, on its own connection.
+    # PASSIVE never waits for readers or the writer; whatever it can't copy now it gets next time.
+    conn = _configure_connection(_connect(DB_FILE))
+    while True:
+        time.sleep(CHECKPOINT_INTERVAL)
+        try:
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        except sqlite3.Error:
+            pass # Busy or similar; try again next round
+
+def _start_checkpointer():
+    global _checkpointer
+    if _checkpointer is None and DB_FILE != ':memory:': # No WAL to checkpoint in memory
+        _checkpointer = threading.Thread(target=_checkpoint_loop, name="wal-checkpoint", daemon=True)
+        _checkpointer.start()
+
+def force_checkpoint():
+    """Writes the whole WAL back to the database file and truncates it. Call before the app exits."""
+    if DB_FILE == ':memory:' or not _schema_ready:
+        return
+    # Runs as a writer job, so no sale is half-way through
+    _submit(lambda conn: conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")).result()
+
+# --- SQL Statements ---
+FETCH_CHUNK = 500 # Rows pulled from SQLite per fetchmany() by the iter_* readers (see _rows)
+# Kept as constants so every call sends the exact same text and hits the connection's statement cache
+# OR IGNORE also skips NOT NULL/CHECK failures, which is why _validate_product must catch bad values first
+SQL_INSERT_PRODUCT = 'INSERT OR IGNORE INTO products (sku, name, price, quantity) VALUES (?, ?, ?, ?)'
+SQL_GET_PRODUCT_NAME = 'SELECT name FROM products WHERE sku = ?'
+SQL_DELETE_PRODUCT = 'DELETE FROM products WHERE sku = ?'
+SQL_GET_ALL_PRODUCTS = 'SELECT sku, name, price, quantity FROM products ORDER BY name'
+SQL_FIND_PRODUCTS = '''
+    SELECT sku, name, price, quantity
+    FROM products
+    WHERE sku = ? OR name LIKE ?
+    ORDER BY name
+'''
+SQL_FIND_PRODUCTS_FTS = '''
+    SELECT sku, name, price, quantity
+    FROM products
+    WHERE sku = ? OR rowid IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)
+    ORDER BY name
+'''
+SQL_GET_PRODUCT = 'SELECT sku, name, price, quantity FROM products WHERE sku = ?'
+# Letters, digits and dashes with at least one digit, e.g. "A1" or "SKU-100": probably a scanned/typed SKU
+SKU_PATTERN = re.compile(r'^(?=.*\d)[A-Z0-9-]+$')
+SQL_INVENTORY_VALUE = 'SELECT COALESCE(SUM(price * quantity), 0.0) FROM products' # 0.0 when there are no products
+SQL_SELL_STOCK = 'UPDATE products SET quantity = quantity - ? WHERE sku = ? AND quantity >= ?'
+SQL_INSERT_TRANSACTION = 'INSERT INTO transactions (total_amount) VALUES (0)' # trg_ti_total adds up the items
+SQL_INSERT_SALE_ITEM = '''
+    INSERT INTO transaction_items (transaction_id, product_sku, quantity_sold, price_at_sale, name_at_sale)
+    VALUES (?, ?, ?, ?, ?)
+'''
+SQL_INSERT_SALE_ITEMS_PREFIX = 'INSERT INTO transaction_items (transaction_id, product_sku, quantity_sold, price_at_sale, name_at_sale) VALUES '
+SALE_ITEMS_CHUNK = 150 # 150 rows x 5 values stays well under SQLite's 999 bound-parameter limit
+MULTI_ROW_VALUES = sqlite3.sqlite_version_info >= (3, 7, 11) # Older SQLite only takes one row per VALUES
+# Receipt header and lines in one query. kind 0 = the transaction (id, timestamp, total, NULL),
+# kind 1 = one row per item (qty, name, sku, price) in the order they were sold
+SQL_GET_TRANSACTION_DETAILS = '''
+    SELECT 0 AS kind, 0 AS seq, transaction_id, timestamp, total_amount, NULL
+    FROM transactions
+    WHERE transaction_id = ?
+    UNION ALL
+    SELECT 1, item_id, quantity_sold, name_at_sale, product_sku, price_at_sale
+    FROM transaction_items
+    WHERE transaction_id = ?
+    ORDER BY kind, seq
+'''
+# transaction_id breaks timestamp ties so pages never overlap or skip rows
+SQL_GET_HISTORY = '''
+    SELECT transaction_id, timestamp, total_amount
+    FROM transactions
+    ORDER BY timestamp DESC, transaction_id DESC
+    LIMIT ? OFFSET ?
+'''
+
 # --- Product Management (Modified for GUI) ---
 
-def add_product(sku, name, price, quantity):
-    """Adds a product. Returns success message or raises error."""
+def _validate_product(sku, name, price, quantity):
+    """Checks and normalizes new product fields. Returns (sku, name, price, quantity) ready to insert."""
     if not sku or not name or price is None or quantity is None:
         raise ValueError("Missing required product information (SKU, Name, Price, Quantity).")
+    try:
+        # The GUI already passes a float and an int; only convert what isn't
+        if type(price) is not float:
+            price = float(price)
+        if type(quantity) is not int:
+            quantity = int(quantity)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid input: {e}")
+    if price != price: # NaN: SQLite would store it as NULL
+        raise ValueError("Invalid input: price is not a number.")
     if price < 0 or quantity < 0:
         raise ValueError("Price and Quantity cannot be negative.")
+    return sku.strip().upper(), name.strip(), price, quantity
 
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO products (sku, name, price, quantity) VALUES (?, ?, ?, ?)',
-                       (sku.strip().upper(), name.strip(), float(price), int(quantity)))
-        conn.commit()
+def add_product(sku, name, price, quantity):
+    """Adds a product. Returns success message or raises error."""
+    row = _validate_product(sku, name, price, quantity)
+
+    def write(conn):
+        try:
+            # A single INSERT is atomic on its own, so no BEGIN needed; `with conn` commits or rolls back
+            with conn:
+                inserted = conn.execute(SQL_INSERT_PRODUCT, row).rowcount # 0 if the SKU was already taken
+        except Exception as e:
+            raise RuntimeError(f"Database error adding product: {e}") # More generic for other DB issues
+        if not inserted:
+            raise ValueError(f"SKU '{sku}' already exists.")
+        _invalidate_details() # A cached "not found" for this SKU is now wrong
         return f"Product '{name}' ({sku}) added."
-    except sqlite3.IntegrityError:
-        conn.rollback()
-        raise ValueError(f"SKU '{sku}' already exists.")
-    except ValueError as e: # Catch potential float/int conversion errors too
-         conn.rollback()
-         raise ValueError(f"Invalid input: {e}")
-    except Exception as e:
-        conn.rollback()
-        raise RuntimeError(f"Database error adding product: {e}") # More generic for other DB issues
-    finally:
-        conn.close()
+    return _submit(write).result() # Runs on the writer thread
 
 def remove_product(sku):
     """Removes a product by SKU. Returns success message or raises error."""
     if not sku:
         raise ValueError("SKU cannot be empty.")
 
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        # Check if product exists first
-        cursor.execute('SELECT name FROM products WHERE sku = ?', (sku,))
-        product = cursor.fetchone()
-        if not product:
-            raise ValueError(f"Product with SKU '{sku}' not found.")
-
-        # Attempt deletion
-        cursor.execute('DELETE FROM products WHERE sku = ?', (sku,))
-        conn.commit()
-        # Check if deletion happened (it should if no FK constraints fail)
-        if cursor.rowcount == 0:
-             # This might happen if it was deleted between the check and now, or due to FK
-             raise RuntimeError(f"Could not delete product '{sku}'. It might be referenced in transactions.")
+    def write(conn):
+        try:
+            with conn: # Commits on success, rolls back on any exception
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE') # Check and delete as one transaction
+                # Check if product exists first
+                cursor.execute(SQL_GET_PRODUCT_NAME, (sku,))
+                product = cursor.fetchone()
+                if not product:
+                    raise ValueError(f"Product with SKU '{sku}' not found.")
+
+                # Attempt deletion
+                cursor.execute(SQL_DELETE_PRODUCT, (sku,))
+                # Check if deletion happened (it should if no FK constraints fail)
+                if cursor.rowcount == 0:
+                     # This might happen if it was deleted between the check and now, or due to FK
+                     raise RuntimeError(f"Could not delete product '{sku}'. It might be referenced in transactions.")
+        except sqlite3.IntegrityError as e:
+             # This will trigger if ON DELETE RESTRICT is active and the product is in transaction_items
+             raise ValueError(f"Cannot remove product '{sku}': It is part of past transactions. ({e})")
+        except Exception as e:
+            raise RuntimeError(f"Database error removing product: {e}")
+        _invalidate_details()
         return f"Product '{product[0]}' ({sku}) removed successfully."
-    except sqlite3.IntegrityError as e:
-         conn.rollback()
-         # This will trigger if ON DELETE RESTRICT is active and the product is in transaction_items
-         raise ValueError(f"Cannot remove product '{sku}': It is part of past transactions. ({e})")
-    except Exception as e:
-        conn.rollback()
-        raise RuntimeError(f"Database error removing product: {e}")
-    finally:
-        conn.close()
+    return _submit(write).result()
+
+def iter_all_products():
+    """Yields all products as tuples (sku, name, price, quantity), FETCH_CHUNK rows at a time.
+    Holds a pooled connection until the generator is exhausted or closed."""
+    with ro_conn() as conn:
+        try:
+            yield from _rows(_execute(conn, SQL_GET_ALL_PRODUCTS))
+        except GeneratorExit:
+            raise # Caller stopped early; just let the connection go back to the pool
+        except Exception as e:
+            raise RuntimeError(f"Database error fetching products: {e}")
 
 def get_all_products():
     """Returns a list of all products as tuples (sku, name, price, quantity)."""
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute('SELECT sku, name, price, quantity FROM products ORDER BY name')
-        products = cursor.fetchall()
-        return products
-    except Exception as e:
-        raise RuntimeError(f"Database error fetching products: {e}")
-    finally:
-        conn.close()
+    return list(iter_all_products())
+
+def get_all_products_columnar():
+    """Returns all products as four lists (skus, names, prices, quantities), in the same order as get_all_products."""
+    rows = get_all_products()
+    if not rows:
+        return [], [], [], []
+    return tuple(map(list, zip(*rows)))
+
+def get_inventory_value():
+    """Returns the total value of all stock (sum of price * quantity), worked out by SQLite."""
+    with ro_conn() as conn:
+        try:
+            return _execute(conn, SQL_INVENTORY_VALUE).fetchone()[0]
+        except Exception as e:
+            raise RuntimeError(f"Database error calculating inventory value: {e}")
 
 def find_products(search_term):
-    """Finds products by SKU or Name (case-insensitive). Returns list of tuples."""
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        search_pattern = f"%{search_term}%"
-        cursor.execute('''
-            SELECT sku, name, price, quantity
-            FROM products
-            WHERE sku = ? OR name LIKE ?
-            ORDER BY name
-        ''', (search_term.strip().upper(), search_pattern))
-        return cursor.fetchall()
-    except Exception as e:
-        raise RuntimeError(f"Database error searching products: {e}")
-    finally:
-        conn.close()
-
-def get_product_details(sku):
-     """Gets details for a single product by SKU."""
-     conn = get_db_connection()
-     try:
-         cursor = conn.cursor()
-         cursor.execute('SELECT sku, name, price, quantity FROM products WHERE sku = ?', (sku,))
-         return cursor.fetchone() # Returns tuple or None
-     except Exception as e:
-        raise RuntimeError(f"Database error getting product details: {e}")
-     finally:
-         conn.close()
+    """Finds products by exact SKU or by Name (case-insensitive). Returns list of tuples.
+    An empty term returns every product; a SKU-like term that matches a SKU exactly returns just that product.
+    Terms of 3+ characters match anywhere in the name ("app" finds "Pineapple") through the products_fts index;
+    shorter terms, or SQLite builds without FTS5, match the start of the name using the name index."""
+    term = search_term.strip()
+    if not term: # Cleared search box: everything matches, no need for a LIKE over every row
+        return get_all_products()
+    sku = term.upper()
+    with ro_conn() as conn:
+        try:
+            if SKU_PATTERN.match(sku): # Looks like a SKU: the primary key answers it on its own if it exists
+                product = _execute(conn, SQL_GET_PRODUCT, (sku,)).fetchone()
+                if product:
+                    return [product]
+            if _fts_enabled and len(term) >= 3: # Trigrams need at least 3 characters
+                fts_query = '"' + term.replace('"', '""') + '"' # Quoted: search for the literal text
+                cursor = _execute(conn, SQL_FIND_PRODUCTS_FTS, (sku, fts_query))
+            else:
+                cursor = _execute(conn, SQL_FIND_PRODUCTS, (sku, f"{term}%"))
+            return cursor.fetchall()
+        except Exception as e:
+            raise RuntimeError(f"Database error searching products: {e}")
+
+# Small LRU cache for get_product_details. Writes bump the generation, and a read only stores
+# its result if no write finished while it was reading, so a row read just before a sale can't stick.
+DETAILS_CACHE_SIZE = 512
+_details_cache = collections.OrderedDict() # sku -> row (or None), least recently used first
+_details_lock = threading.Lock()
+_details_generation = 0
+
+def _invalidate_details():
+    # Called by add_product, remove_product and process_sale after they commit
+    global _details_generation
+    with _details_lock:
+        _details_generation += 1
+        _details_cache.clear()
+
+def _read_details(sku):
+     with ro_conn() as conn:
+         try:
+             return _execute(conn, SQL_GET_PRODUCT, (sku,)).fetchone() # Returns tuple or None
+         except Exception as e:
+            raise RuntimeError(f"Database error getting product details: {e}")
+
+def get_product_details(sku, cache=True):
+     """Gets details for a single product by SKU. Repeat lookups come from memory unless cache=False."""
+     if not cache:
+         return _read_details(sku) # Always read the database
+     with _details_lock:
+         if sku in _details_cache:
+             _details_cache.move_to_end(sku)
+             return _details_cache[sku]
+         generation = _details_generation
+     details = _read_details(sku)
+     with _details_lock:
+         if generation == _details_generation: # Otherwise a write landed mid-read; don't cache what may be stale
+             _details_cache[sku] = details
+             if len(_details_cache) > DETAILS_CACHE_SIZE:
+                 _details_cache.popitem(last=False)
+     return details
 
 # --- Billing (Modified for GUI) ---
 
+def _insufficient_stock_error(cursor, bill_items):
+    """Builds the error for a failed sale, naming the first bill line that there isn't enough stock for."""
+    needed = {} # sku -> total quantity on the bill (a SKU could be listed more than once)
+    for sku, name, price_at_sale, quantity_sold in bill_items:
+        needed[sku] = needed.get(sku, 0) + quantity_sold
+    placeholders = ",".join("?" * len(needed))
+    cursor.execute(f'SELECT sku, quantity FROM products WHERE sku IN ({placeholders})', list(needed))
+    stock = dict(cursor.fetchall())
+    for sku, name, price_at_sale, quantity_sold in bill_items:
+        if stock.get(sku, 0) < needed[sku]:
+            return ValueError(f"Insufficient stock for '{name}' ({sku}) during final checkout. Only {stock.get(sku, 0)} left.")
+    return ValueError("Insufficient stock for one or more items during final checkout.")
+
+def _insert_sale_items(cursor, transaction_id, bill_items):
+    """Writes the bill lines to transaction_items, SALE_ITEMS_CHUNK rows per INSERT statement."""
+    rows = [(transaction_id, sku, quantity_sold, price_at_sale, name) for sku, name, price_at_sale, quantity_sold in bill_items]
+    if not MULTI_ROW_VALUES:
+        cursor.executemany(SQL_INSERT_SALE_ITEM, rows)
+        return
+    for start in range(0, len(rows), SALE_ITEMS_CHUNK):
+        chunk = rows[start:start + SALE_ITEMS_CHUNK]
+        params = [value for row in chunk for value in row] # Flatten to match the placeholders
+        cursor.execute(SQL_INSERT_SALE_ITEMS_PREFIX + ",".join(["(?,?,?,?,?)"] * len(chunk)), params)
+
 def process_sale(bill_items):
     """
     Processes the sale transaction.
@@ -151,101 +553,64 @@ def process_sale(bill_items):
     if not bill_items:
         raise ValueError("Cannot process an empty bill.")
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    current_total = sum(item[2] * item[3] for item in bill_items)
+    def write(conn):
+        try:
+            with conn: # Commits at the end of the block, rolls back if anything in it raises
+                cursor = conn.cursor()
+                # Take the write lock up front so nothing can change stock between our statements
+                cursor.execute('BEGIN IMMEDIATE')
 
-    try:
-        # Step 1: Create Transaction Record
-        cursor.execute('INSERT INTO transactions (total_amount) VALUES (?)', (current_total,))
-        transaction_id = cursor.lastrowid
-
-        # Step 2: Add Items to transaction_items and Update Stock
-        for sku, name, price_at_sale, quantity_sold in bill_items:
-            # Check stock again just before updating (important!)
-            cursor.execute('SELECT quantity FROM products WHERE sku = ?', (sku,))
-            current_stock = cursor.fetchone()
-            if not current_stock or current_stock[0] < quantity_sold:
-                 raise ValueError(f"Insufficient stock for '{name}' ({sku}) during final checkout. Only {current_stock[0] if current_stock else 0} left.")
-
-            # Add item to transaction details
-            cursor.execute('''
-                INSERT INTO transaction_items (transaction_id, product_sku, quantity_sold, price_at_sale)
-                VALUES (?, ?, ?, ?)
-            ''', (transaction_id, sku, quantity_sold, price_at_sale))
-
-            # Update product stock
-            cursor.execute('''
-                UPDATE products SET quantity = quantity - ? WHERE sku = ?
-            ''', (quantity_sold, sku))
-            # No need for rowcount check here as we checked stock above, rely on commit/rollback
-
-        # Step 3: Commit Transaction
-        conn.commit()
-        return transaction_id
+                # Step 1: Update stock. The WHERE clause only lets a row change if there is enough stock,
+                # so SQLite does the stock check itself and rowcount tells us if every line went through.
+                cursor.executemany(SQL_SELL_STOCK, [(quantity_sold, sku, quantity_sold) for sku, _, _, quantity_sold in bill_items])
+                if cursor.rowcount != len(bill_items):
+                    conn.rollback() # Undo the lines that did go through, then find out which one was short
+                    raise _insufficient_stock_error(cursor, bill_items)
 
-    except Exception as e:
-        conn.rollback() # Rollback the transaction
-        # Raise a more specific error if possible, otherwise generic
-        if isinstance(e, ValueError): # Re-raise our specific stock error
-             raise e
-        raise RuntimeError(f"Database error during checkout: {e}")
-    finally:
-        conn.close()
+                # Step 2: Create Transaction Record (total starts at 0 and is filled in by the trigger in step 3)
+                cursor.execute(SQL_INSERT_TRANSACTION)
+                transaction_id = cursor.lastrowid
+
+                # Step 3: Add all items to transaction_items (one multi-row INSERT per 150 lines)
+                _insert_sale_items(cursor, transaction_id, bill_items)
+        except ValueError: # Our specific stock error
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Database error during checkout: {e}")
+
+        _invalidate_details() # Stock levels changed
+        return transaction_id
+    return _submit(write).result()
 
 
 # --- Receipt and History (Modified for GUI) ---
 
 def get_transaction_details(transaction_id):
     """Gets details for receipt printing. Returns (trans_info_tuple, items_list_of_tuples)"""
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        # Get transaction info
-        cursor.execute('SELECT transaction_id, timestamp, total_amount FROM transactions WHERE transaction_id = ?', (transaction_id,))
-        trans_info = cursor.fetchone()
-        if not trans_info:
-            raise ValueError(f"Transaction ID {transaction_id} not found.")
-
-        # Get items for this transaction
-        cursor.execute('''
-            SELECT ti.quantity_sold, p.name, ti.product_sku, ti.price_at_sale
-            FROM transaction_items ti
-            JOIN products p ON ti.product_sku = p.sku
-            WHERE ti.transaction_id = ?
-        ''', (transaction_id,))
-        items = cursor.fetchall() # List of (qty, name, sku, price) tuples
-        return trans_info, items
-    except Exception as e:
-        raise RuntimeError(f"Database error fetching transaction details: {e}")
-    finally:
-        conn.close()
+    with ro_conn() as conn:
+        try:
+            rows = _execute(conn, SQL_GET_TRANSACTION_DETAILS, (transaction_id, transaction_id)).fetchall()
+            if not rows or rows[0][0] != 0: # No header row: the transaction doesn't exist
+                raise ValueError(f"Transaction ID {transaction_id} not found.")
 
+            trans_info = tuple(rows[0][2:5]) # (id, timestamp, total)
+            items = [tuple(row[2:6]) for row in rows[1:]] # List of (qty, name, sku, price) tuples
+            return trans_info, items
+        except Exception as e:
+            raise RuntimeError(f"Database error fetching transaction details: {e}")
 
-def get_transaction_history(limit=50):
-    """Returns a list of recent transactions as tuples (id, timestamp, total)."""
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT transaction_id, timestamp, total_amount
-            FROM transactions
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (limit,))
-        return cursor.fetchall()
-    except Exception as e:
-        raise RuntimeError(f"Database error fetching transaction history: {e}")
-    finally:
-        conn.close()
-
-# --- Initialize DB on first import/run if needed ---
-if not os.path.exists(DB_FILE):
-     print(f"Database file '{DB_FILE}' not found. Initializing...")
-     try:
-         init_db()
-         print("Database initialized successfully.")
-     except Exception as e:
-         print(f"FATAL ERROR: Could not initialize database: {e}")
-         # In a GUI app, you might show an error dialog and exit here
-         exit() # Exit if DB init fails critically
\ No newline at end of file
+
+def iter_transaction_history(limit=50, offset=0):
+    """Yields a page of recent transactions as tuples (id, timestamp, total), newest first, FETCH_CHUNK rows at a time.
+    Pass limit=-1 for no limit. Holds a pooled connection until the generator is exhausted or closed."""
+    with ro_conn() as conn:
+        try:
+            yield from _rows(_execute(conn, SQL_GET_HISTORY, (limit, offset)))
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Database error fetching transaction history: {e}")
+
+def get_transaction_history(limit=50, offset=0):
+    """Returns a page of recent transactions as tuples (id, timestamp, total), newest first."""
+    return list(iter_transaction_history(limit, offset))